@@ -1,170 +1,152 @@
-from dotenv import load_dotenv
 import os
+import discord
 import requests
-from datetime import datetime, timedelta
+from datetime import date, timedelta
+from common import NOTION_API_KEY, DATABASE_ID, INCOMPLETE_STATUS_FILTERS
+import notion_cache
 
-load_dotenv()
-
-# Load environment variables
-NOTION_API_KEY = os.getenv("NOTION_API_KEY")
-DATABASE_ID = os.getenv("DATABASE_ID")
+# Load environment variables (common has already loaded .env)
 DISCORD_WEBHOOK_URL = os.getenv("DISCORD_WEBHOOK_URL")
 DISCORD_USER_ID = os.getenv("DISCORD_USER_ID")
 
-# Validate required environment variables
-if not all([NOTION_API_KEY, DATABASE_ID, DISCORD_WEBHOOK_URL]):
-    raise ValueError("Missing required environment variables. Please check your .env file.")
-
-# Headers for Notion API
-HEADERS = {
-    "Authorization": f"Bearer {NOTION_API_KEY}",
-    "Notion-Version": "2022-06-28",
-    "Content-Type": "application/json"
+# Map lowercase Notion names to Discord user IDs from DISCORD_ID_[NAME_IN_CAPS] variables
+_ENV_KEY_TO_NAME = str.maketrans("_", " ")
+NAME_TO_ID = {
+    key[len("DISCORD_ID_"):].translate(_ENV_KEY_TO_NAME).lower(): value
+    for key, value in os.environ.items()
+    if key.startswith("DISCORD_ID_") and value
 }
 
-# Get today's date and 24 hours from now (using local timezone)
-today = datetime.now().date()
-tomorrow = today + timedelta(days=1)
+# Webhook client, built on first use by _get_webhook
+_webhook = None
 
+# Discord rejects message content longer than this
+DISCORD_MESSAGE_LIMIT = 2000
 
-def extract_task_name(props):
-    """Extract task name from the 'Task' property"""
-    task_prop = props.get("Task", {})
-    
-    if task_prop.get("title") and len(task_prop["title"]) > 0:
-        first_block = task_prop["title"][0]
-        if first_block.get("text", {}).get("content"):
-            name = first_block["text"]["content"].strip()
-            if name:
-                return name
-    
-    return "Unnamed Task"
 
-
-def extract_assigned_people(props):
-    """Extract assigned people from the 'Assign' property (handles both people and multi_select types)"""
-    assign_prop = props.get("Assign", {})
-    assigned_names = []
+def build_alert_line(task_name, due_date, assigned_people=None, is_overdue=False):
+    """Build one reminder line and return it with the Discord IDs it mentions"""
+    discord_ids = []
+    discord_tags = ""
     
-    # Handle people property type
-    if assign_prop.get("people") and isinstance(assign_prop["people"], list):
-        for person in assign_prop["people"]:
-            if person.get("name"):
-                assigned_names.append(person["name"])
+    if assigned_people:
+        # Create Discord tags for assigned people
+        for person in assigned_people:
+            discord_id = NAME_TO_ID.get(person.lower())
+            if not discord_id:
+                continue
+            # A malformed ID would make Discord reject the whole batched message
+            if not discord_id.isdigit():
+                print(f"⚠️ Ignoring non-numeric Discord ID for {person}: {discord_id!r}")
+                continue
+            discord_ids.append(discord_id)
+        
+        if discord_ids:
+            discord_tags = f" {' '.join(f'<@{discord_id}>' for discord_id in discord_ids)}"
     
-    # Handle multi_select property type (your case)
-    elif assign_prop.get("multi_select") and isinstance(assign_prop["multi_select"], list):
-        for option in assign_prop["multi_select"]:
-            if option.get("name"):
-                assigned_names.append(option["name"])
+    # Different message format for overdue vs tomorrow reminders
+    if is_overdue:
+        line = f"🚨 **OVERDUE!** **{task_name}** was due on **{due_date}**{discord_tags}"
+    else:
+        line = f"⏰ Reminder! **{task_name}** is due on **{due_date}** — that's tomorrow! {discord_tags}"
     
-    return assigned_names
+    return line, discord_ids
 
 
-def extract_task_status(props):
-    """Extract task status from the 'Status' property"""
-    status_prop = props.get("Status", {})
-    
-    # Handle status property type (Notion's dedicated status property)
-    if status_prop.get("status") and status_prop["status"].get("name"):
-        return status_prop["status"]["name"]
+def split_message(content, limit=DISCORD_MESSAGE_LIMIT):
+    """Split content into chunks under Discord's message limit, breaking on newlines"""
+    chunks = []
+    current = ""
     
-    # Handle select property type (single select) - fallback
-    elif status_prop.get("select") and status_prop["select"].get("name"):
-        return status_prop["select"]["name"]
+    for line in content.split("\n"):
+        # Hard-wrap any single line that is longer than the limit
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:limit])
+            line = line[limit:]
+        
+        if current and len(current) + 1 + len(line) > limit:
+            chunks.append(current)
+            current = line
+        else:
+            current = f"{current}\n{line}" if current else line
     
-    # Handle multi_select property type (if Status is multi-select) - fallback
-    elif status_prop.get("multi_select") and len(status_prop["multi_select"]) > 0:
-        return status_prop["multi_select"][0].get("name")
+    if current:
+        chunks.append(current)
     
-    return None
-
+    return chunks
 
-def get_discord_user_id(name):
-    """Map Notion names to Discord user IDs using environment variables"""
-    # Convert name to environment variable format
-    env_key = f"DISCORD_ID_{name.upper().replace(' ', '_')}"
-    return os.getenv(env_key)
 
-
-def send_discord_alert(task_name, due_date, assigned_people=None, is_overdue=False):
-    # Build the message with assigned people info and Discord tags
-    assigned_text = ""
-    discord_tags = ""
+def _get_webhook():
+    """Return the shared webhook client, or None if DISCORD_WEBHOOK_URL is not usable
     
-    if assigned_people:
-        # Show assigned people names
-        if len(assigned_people) == 1:
-            assigned_text = f" | Assigned to: **{assigned_people[0]}**"
-        else:
-            assigned_text = f" | Assigned to: **{', '.join(assigned_people)}**"
-        
-        # Create Discord tags for assigned people
-        discord_mentions = []
-        for person in assigned_people:
-            discord_id = get_discord_user_id(person)
-            if discord_id:
-                discord_mentions.append(f"<@{discord_id}>")
-        
-        if discord_mentions:
-            discord_tags = f" {' '.join(discord_mentions)}"
+    discord.py tracks Discord's rate-limit buckets and retries 429s itself.
+    """
+    global _webhook
+    if _webhook is None and DISCORD_WEBHOOK_URL:
+        try:
+            _webhook = discord.SyncWebhook.from_url(DISCORD_WEBHOOK_URL, session=requests.Session())
+        except ValueError as e:
+            print(f"❌ Invalid DISCORD_WEBHOOK_URL: {e}")
+    return _webhook
+
+
+def send_discord_alerts(tasks, is_overdue=False):
+    """Send reminders for all tasks as one webhook message (split only if over Discord's limit)"""
+    if not tasks:
+        return
     
-    # Different message format for overdue vs tomorrow reminders
-    if is_overdue:
-        message = {
-            "content": f"🚨 **OVERDUE!** **{task_name}** was due on **{due_date}**{discord_tags}"
-        }
-    else:
-        message = {
-            "content": f"⏰ Reminder! **{task_name}** is due on **{due_date}** — that's tomorrow! {discord_tags}"
-        }
+    lines = []
+    mentioned_ids = []
+    for task in tasks:
+        line, discord_ids = build_alert_line(task.name, task.due_date, task.assignees, is_overdue)
+        lines.append(line)
+        mentioned_ids.extend(discord_ids)
     
-    try:
-        response = requests.post(DISCORD_WEBHOOK_URL, json=message)
-        response.raise_for_status()
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Failed to send Discord alert: {e}")
+    # Keep first-seen order while mentioning each person only once
+    # (build_alert_line only returns numeric IDs, so int() cannot fail here)
+    allowed_mentions = discord.AllowedMentions(
+        everyone=False,
+        roles=False,
+        users=[discord.Object(id=int(discord_id)) for discord_id in dict.fromkeys(mentioned_ids)]
+    )
+    
+    webhook = _get_webhook()
+    if webhook is None:
+        print("❌ Skipping Discord alerts: no valid webhook configured")
+        return
+    
+    for chunk in split_message("\n".join(lines)):
+        try:
+            webhook.send(content=chunk, allowed_mentions=allowed_mentions)
+        except (discord.HTTPException, requests.exceptions.RequestException) as e:
+            print(f"❌ Failed to send Discord alert: {e}")
 
 
-def check_overdue_tasks():
+def check_overdue_tasks(today=None):
     """Check for overdue tasks that are still 'To do' or 'In progress'"""
-    url = f"https://api.notion.com/v1/databases/{DATABASE_ID}/query"
+    # Work out dates per run so a long-lived process never uses a stale day
+    if today is None:
+        today = date.today()
+    
+    overdue_filter = {
+        "and": [
+            {"property": "Due Date", "date": {"before": today.isoformat()}},
+            {"or": INCOMPLETE_STATUS_FILTERS}
+        ]
+    }
     
     try:
-        response = requests.post(url, headers=HEADERS)
-        response.raise_for_status()
+        # Each check runs once per run with its own filter, so there is nothing to cache.
+        # The query only returns overdue, incomplete tasks
+        overdue_tasks = notion_cache.query_database(overdue_filter)
         
-        results = response.json().get("results", [])
-        overdue_count = 0
-
-        for page in results:
-            try:
-                props = page["properties"]
-
-                # Extract task info
-                name = extract_task_name(props)
-                assigned_people = extract_assigned_people(props)
-                status = extract_task_status(props)
-                
-                # Check if task is overdue and still incomplete
-                date_prop = props.get("Due Date", {}).get("date")
-                if date_prop and date_prop.get("start"):
-                    due_date = datetime.fromisoformat(date_prop["start"]).date()
-                    
-                    # Check if overdue and status is still "To do" or "In progress"
-                    if (due_date < today and 
-                        status and 
-                        status in ["To do", "In progress"]):
-                        
-                        send_discord_alert(name, due_date, assigned_people, is_overdue=True)
-                        overdue_count += 1
-                        
-            except (KeyError, IndexError, ValueError) as e:
-                print(f"⚠️ Error processing overdue task: {e}")
-                continue
-                
-        if overdue_count > 0:
-            print(f"🚨 Found {overdue_count} overdue task(s)")
+        send_discord_alerts(overdue_tasks, is_overdue=True)
+        
+        if overdue_tasks:
+            print(f"🚨 Found {len(overdue_tasks)} overdue task(s)")
         else:
             print("✅ No overdue tasks found")
                 
@@ -174,40 +156,31 @@ def check_overdue_tasks():
         print(f"❌ Unexpected error checking overdue tasks: {e}")
 
 
-def check_due_tasks():
-    url = f"https://api.notion.com/v1/databases/{DATABASE_ID}/query"
+def check_due_tasks(today=None):
+    if today is None:
+        today = date.today()
+    tomorrow = today + timedelta(days=1)
+    
+    due_filter = {"property": "Due Date", "date": {"equals": tomorrow.isoformat()}}
     
     try:
-        response = requests.post(url, headers=HEADERS)
-        response.raise_for_status()
+        # Each check runs once per run with its own filter, so there is nothing to cache.
+        # The query only returns tasks due tomorrow
+        due_tasks = notion_cache.query_database(due_filter)
+        
+        send_discord_alerts(due_tasks)
         
-        results = response.json().get("results", [])
-
-        for page in results:
-            try:
-                props = page["properties"]
-
-                # Extract task name and assigned people
-                name = extract_task_name(props)
-                assigned_people = extract_assigned_people(props)
-                
-                # Check due date
-                date_prop = props.get("Due Date", {}).get("date")
-                if date_prop and date_prop.get("start"):
-                    due_date = datetime.fromisoformat(date_prop["start"]).date()
-                    if due_date == tomorrow:
-                        send_discord_alert(name, due_date, assigned_people)
-                        
-            except (KeyError, IndexError, ValueError) as e:
-                print(f"⚠️ Error processing task: {e}")
-                continue
-                
     except requests.exceptions.RequestException as e:
         print(f"❌ Failed to connect to Notion API: {e}")
     except Exception as e:
         print(f"❌ Unexpected error: {e}")
 
 
-# Run both functions
-check_due_tasks()
-check_overdue_tasks()
+if __name__ == "__main__":
+    # Validate required environment variables (checked here so importing this module never fails)
+    if not all([NOTION_API_KEY, DATABASE_ID, DISCORD_WEBHOOK_URL]):
+        raise ValueError("Missing required environment variables. Please check your .env file.")
+    
+    # Run both checks once (the bot also schedules them daily)
+    check_due_tasks()
+    check_overdue_tasks()
@@ -0,0 +1,77 @@
+"""
+Shared Configuration and Notion Parsing
+Environment and task parsing used by both Reminder.py and discord_bot.py
+"""
+
+from dotenv import load_dotenv
+import os
+from dataclasses import dataclass
+from datetime import date
+
+# Load environment variables (importing this module loads .env for every entry point)
+load_dotenv()
+
+NOTION_API_KEY = os.getenv("NOTION_API_KEY")
+DATABASE_ID = os.getenv("DATABASE_ID")
+
+# Headers for Notion API
+HEADERS = {
+    "Authorization": f"Bearer {NOTION_API_KEY}",
+    "Notion-Version": "2022-06-28",
+    "Content-Type": "application/json"
+}
+
+# Notion filter predicates matching a status that still needs a reminder once overdue
+INCOMPLETE_STATUS_FILTERS = [
+    {"property": "Status", "status": {"equals": status}} for status in ("To do", "In progress")
+]
+
+
+@dataclass(slots=True)
+class Task:
+    """The fields of a Notion task page that reminders and summaries use"""
+    name: str
+    assignees: list
+    assignees_lower: frozenset
+    status: str | None
+    due_date: date
+
+
+def parse_page(page):
+    """Parse a Notion page into a Task in one pass over its properties
+    
+    Returns None for pages without a due date, since nothing can be reminded about them.
+    """
+    props = page["properties"]
+    
+    date_prop = props.get("Due Date", {}).get("date")
+    if not date_prop or not date_prop.get("start"):
+        return None
+    # Only the calendar day matters, so skip parsing any time/timezone suffix
+    due_date = date.fromisoformat(date_prop["start"][:10])
+    
+    # Task name from the 'Task' title property
+    name = "Unnamed Task"
+    title = props.get("Task", {}).get("title")
+    if title:
+        content = title[0].get("text", {}).get("content")
+        if content and content.strip():
+            name = content.strip()
+    
+    # Assigned people from 'Assign' (handles both people and multi_select types)
+    assign_prop = props.get("Assign", {})
+    options = assign_prop.get("people")
+    if not (options and isinstance(options, list)):
+        options = assign_prop.get("multi_select")
+        if not isinstance(options, list):
+            options = []
+    assignees = [option["name"] for option in options if option.get("name")]
+    
+    # Status from 'Status', which must be Notion's dedicated status property: the queries
+    # filter on it with the "status" filter type, which Notion rejects for select properties
+    status = None
+    status_prop = props.get("Status", {})
+    if status_prop.get("status") and status_prop["status"].get("name"):
+        status = status_prop["status"]["name"]
+    
+    return Task(name, assignees, frozenset(n.lower() for n in assignees), status, due_date)
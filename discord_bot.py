@@ -6,17 +6,17 @@ Responds to commands like !kyle to show personalized task summaries
 
 import discord
 from discord.ext import commands
-from dotenv import load_dotenv
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
 import os
-import requests
-from datetime import datetime, timedelta
-
-# Load environment variables
-load_dotenv()
-
-# Get environment variables
-NOTION_API_KEY = os.getenv("NOTION_API_KEY")
-DATABASE_ID = os.getenv("DATABASE_ID")
+import io
+import asyncio
+import aiohttp
+from datetime import date, timedelta
+from common import NOTION_API_KEY, DATABASE_ID, HEADERS, INCOMPLETE_STATUS_FILTERS
+import notion_cache
+from Reminder import DISCORD_WEBHOOK_URL, check_due_tasks, check_overdue_tasks
+
+# Get environment variables (common has already loaded .env)
 DISCORD_BOT_TOKEN = os.getenv("DISCORD_BOT_TOKEN")
 
 # Get Discord ID mappings
@@ -43,132 +43,92 @@ if DISCORD_ID_KENNY:
 if DISCORD_ID_NIKKI:
     DISCORD_TO_NOTION[DISCORD_ID_NIKKI] = "Nikki"
 
-# Headers for Notion API
-HEADERS = {
-    "Authorization": f"Bearer {NOTION_API_KEY}",
-    "Notion-Version": "2022-06-28",
-    "Content-Type": "application/json"
-}
+# Personal task commands handled in on_message
+_COMMANDS = frozenset({'!me', '!tasks', '!mytasks'})
+_COMMAND_MAX_LEN = max(len(command) for command in _COMMANDS)
 
-# Get date ranges
-today = datetime.now().date()
-tomorrow = today + timedelta(days=1)
-week_end = today + timedelta(days=7)
+# Non-blocking Notion session, opened in TaskBot.setup_hook before any events are dispatched
+aio_session = None
 
-# Bot setup
-intents = discord.Intents.default()
-intents.message_content = True
-bot = commands.Bot(command_prefix='!', intents=intents)
+# Seconds to reuse a Notion query between task commands
+NOTION_CACHE_TTL = 60
 
 
-def extract_task_name(props):
-    """Extract task name from the 'Task' property"""
-    task_prop = props.get("Task", {})
+class TaskBot(commands.Bot):
+    """Bot that owns the aiohttp session used for Notion queries"""
     
-    if task_prop.get("title") and len(task_prop["title"]) > 0:
-        first_block = task_prop["title"][0]
-        if first_block.get("text", {}).get("content"):
-            name = first_block["text"]["content"].strip()
-            if name:
-                return name
+    async def setup_hook(self):
+        global aio_session
+        aio_session = aiohttp.ClientSession(headers=HEADERS)
     
-    return "Unnamed Task"
-
+    async def close(self):
+        await super().close()
+        if aio_session is not None:
+            await aio_session.close()
 
-def extract_assigned_people(props):
-    """Extract assigned people from the 'Assign' property (handles both people and multi_select types)"""
-    assign_prop = props.get("Assign", {})
-    assigned_names = []
-    
-    # Handle people property type
-    if assign_prop.get("people") and isinstance(assign_prop["people"], list):
-        for person in assign_prop["people"]:
-            if person.get("name"):
-                assigned_names.append(person["name"])
-    
-    # Handle multi_select property type (your case)
-    elif assign_prop.get("multi_select") and isinstance(assign_prop["multi_select"], list):
-        for option in assign_prop["multi_select"]:
-            if option.get("name"):
-                assigned_names.append(option["name"])
-    
-    return assigned_names
 
+# Bot setup
+intents = discord.Intents.default()
+intents.message_content = True
+bot = TaskBot(command_prefix='!', intents=intents)
 
-def extract_task_status(props):
-    """Extract task status from the 'Status' property"""
-    status_prop = props.get("Status", {})
-    
-    # Handle status property type (Notion's dedicated status property)
-    if status_prop.get("status") and status_prop["status"].get("name"):
-        return status_prop["status"]["name"]
-    
-    # Handle select property type (single select) - fallback
-    elif status_prop.get("select") and status_prop["select"].get("name"):
-        return status_prop["select"]["name"]
-    
-    # Handle multi_select property type (if Status is multi-select) - fallback
-    elif status_prop.get("multi_select") and len(status_prop["multi_select"]) > 0:
-        return status_prop["multi_select"][0].get("name")
-    
-    return None
+# Daily webhook reminders run inside the bot process (only when a webhook is configured)
+scheduler = AsyncIOScheduler()
+if DISCORD_WEBHOOK_URL:
+    scheduler.add_job(check_due_tasks, 'cron', hour=9)
+    scheduler.add_job(check_overdue_tasks, 'cron', hour=9, minute=5)
 
 
-def get_user_tasks(person_name):
-    """Get tasks for a specific person"""
-    url = f"https://api.notion.com/v1/databases/{DATABASE_ID}/query"
+async def get_user_tasks(person_name, today=None):
+    """Get tasks for a specific person (relative to today, which defaults to the current date)"""
+    if today is None:
+        today = date.today()
+    tomorrow = today + timedelta(days=1)
+    week_end = today + timedelta(days=7)
+    
+    # Tasks due this week, or overdue and still incomplete. Assignees are matched below
+    # rather than in the filter, since 'Assign' may be a people or multi_select property
+    # and names are compared case-insensitively. The filter is the same for every user,
+    # so all task commands share one cached query.
+    user_filter = {
+        "and": [
+            {"property": "Due Date", "date": {"on_or_before": week_end.isoformat()}},
+            {
+                "or": [
+                    {"property": "Due Date", "date": {"on_or_after": today.isoformat()}},
+                    *INCOMPLETE_STATUS_FILTERS
+                ]
+            }
+        ]
+    }
     
     try:
-        response = requests.post(url, headers=HEADERS)
-        response.raise_for_status()
-        
-        results = response.json().get("results", [])
+        tasks = await notion_cache.get_tasks_async(
+            aio_session, user_filter, ttl=NOTION_CACHE_TTL, database_id=DATABASE_ID
+        )
         user_tasks = {
             "overdue": [],
             "due_this_week": [],
             "due_tomorrow": []
         }
+        needle = person_name.lower()
 
-        for page in results:
-            try:
-                props = page["properties"]
-
-                # Extract task info
-                name = extract_task_name(props)
-                assigned_people = extract_assigned_people(props)
-                status = extract_task_status(props)
-                
-                # Check if this person is assigned to the task
-                if person_name.lower() not in [person.lower() for person in assigned_people]:
-                    continue
-                
-                # Check due date
-                date_prop = props.get("Due Date", {}).get("date")
-                if date_prop and date_prop.get("start"):
-                    due_date = datetime.fromisoformat(date_prop["start"]).date()
-                    
-                    task_info = {
-                        "name": name,
-                        "due_date": due_date,
-                        "status": status,
-                        "assigned_people": assigned_people
-                    }
-                    
-                    # Categorize tasks
-                    if due_date < today and status in ["To do", "In progress"]:
-                        user_tasks["overdue"].append(task_info)
-                    elif due_date == tomorrow:
-                        user_tasks["due_tomorrow"].append(task_info)
-                    elif today <= due_date <= week_end:
-                        user_tasks["due_this_week"].append(task_info)
-                        
-            except (KeyError, IndexError, ValueError) as e:
-                print(f"⚠️ Error processing task: {e}")
+        for task in tasks:
+            # Skip tasks not assigned to this person
+            if needle not in task.assignees_lower:
                 continue
+            
+            # Categorize tasks (anything before today is an incomplete overdue task)
+            if task.due_date < today:
+                user_tasks["overdue"].append(task)
+            elif task.due_date == tomorrow:
+                user_tasks["due_tomorrow"].append(task)
+            else:
+                user_tasks["due_this_week"].append(task)
                 
         return user_tasks
                 
-    except requests.exceptions.RequestException as e:
+    except aiohttp.ClientError as e:
         print(f"❌ Failed to get user tasks: {e}")
         return None
     except Exception as e:
@@ -198,7 +158,7 @@ def format_task_summary(discord_user, tasks):
     if overdue_count > 0:
         message_parts.append(f"🚨 **OVERDUE ({overdue_count})**")
         for task in tasks["overdue"][:5]:  # Limit to 5 tasks
-            message_parts.append(f"• **{task['name']}** (due {task['due_date']}) - *{task['status']}*")
+            message_parts.append(f"• **{task.name}** (due {task.due_date}) - *{task.status}*")
         if overdue_count > 5:
             message_parts.append(f"• ... and {overdue_count - 5} more overdue tasks")
         message_parts.append("")
@@ -207,14 +167,14 @@ def format_task_summary(discord_user, tasks):
     if tomorrow_count > 0:
         message_parts.append(f"⏰ **DUE TOMORROW ({tomorrow_count})**")
         for task in tasks["due_tomorrow"]:
-            message_parts.append(f"• **{task['name']}** - *{task['status']}*")
+            message_parts.append(f"• **{task.name}** - *{task.status}*")
         message_parts.append("")
     
     # Due this week
     if week_count > 0:
         message_parts.append(f"📅 **DUE THIS WEEK ({week_count})**")
         for task in tasks["due_this_week"][:5]:  # Limit to 5 tasks
-            message_parts.append(f"• **{task['name']}** (due {task['due_date']}) - *{task['status']}*")
+            message_parts.append(f"• **{task.name}** (due {task.due_date}) - *{task.status}*")
         if week_count > 5:
             message_parts.append(f"• ... and {week_count - 5} more tasks this week")
     
@@ -223,9 +183,20 @@ def format_task_summary(discord_user, tasks):
 
 @bot.event
 async def on_ready():
+    # Start from fresh Notion data after (re)connecting
+    notion_cache.invalidate(DATABASE_ID)
+    
+    # on_ready fires again after reconnects, so only start the scheduler once
+    if not scheduler.running:
+        scheduler.start()
+    
     print(f'✅ {bot.user} is now online!')
     print(f'📋 Ready to respond to personal task commands: !me, !tasks, !mytasks')
     print(f'👥 Registered users: {len(DISCORD_TO_NOTION)} ({", ".join(DISCORD_TO_NOTION.values())})')
+    if DISCORD_WEBHOOK_URL:
+        print(f'⏰ Scheduled reminders: due tomorrow at 09:00, overdue at 09:05')
+    else:
+        print(f'⏰ Scheduled reminders disabled: DISCORD_WEBHOOK_URL is not set')
 
 
 @bot.event
@@ -245,8 +216,9 @@ async def on_message(message):
     if message.author == bot.user:
         return
     
-    # Check for personal task commands
-    if message.content.lower() in ['!me', '!tasks', '!mytasks']:
+    # Check for personal task commands (the length check skips lowercasing ordinary chat)
+    content = message.content
+    if len(content) <= _COMMAND_MAX_LEN and content.lower() in _COMMANDS:
         user_discord_id = str(message.author.id)
         
         # Look up user's Notion name
@@ -256,22 +228,20 @@ async def on_message(message):
             await message.channel.send("❌ You're not registered in the system. Contact an admin to add your Discord ID.")
             return
         
-        # Send "typing" indicator
-        async with message.channel.typing():
-            # Get tasks for this person
-            tasks = get_user_tasks(notion_name)
-            
-            # Format and send response
-            response = format_task_summary(message.author, tasks)
-            
-            # Split long messages if needed (Discord has 2000 char limit)
-            if len(response) > 2000:
-                # Send in chunks
-                chunks = [response[i:i+2000] for i in range(0, len(response), 2000)]
-                for chunk in chunks:
-                    await message.channel.send(chunk)
-            else:
-                await message.channel.send(response)
+        # Get tasks for this person while the "typing" indicator is sent
+        tasks, _ = await asyncio.gather(get_user_tasks(notion_name), message.channel.typing())
+        
+        # Format and send response
+        response = format_task_summary(message.author, tasks)
+        
+        # Discord caps messages at 2000 chars, so send long summaries as one embed or file instead
+        if len(response) <= 2000:
+            await message.channel.send(response)
+        elif len(response) <= 4096:
+            await message.channel.send(embed=discord.Embed(description=response))
+        else:
+            summary_file = discord.File(io.BytesIO(response.encode()), filename='tasks.txt')
+            await message.channel.send(file=summary_file)
     
     # Process other commands
     await bot.process_commands(message)
@@ -0,0 +1,173 @@
+"""
+Notion Query Cache
+Streams Notion database queries into Tasks and caches recent results for bot commands
+"""
+
+import time
+import asyncio
+import ijson
+from ijson.common import ObjectBuilder
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from common import DATABASE_ID, HEADERS, parse_page
+
+# Shared keep-alive session for Notion API calls (queries are reads, so POST is retried too)
+session = requests.Session()
+session.headers.update(HEADERS)
+session.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=10,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 502, 503], allowed_methods=None)
+))
+
+# Maximum page size accepted by the Notion query endpoint
+PAGE_SIZE = 100
+
+# Cached query results: (database ID, filter) -> (timestamp, tasks)
+_cache = {}
+
+# Notion fetches currently running for the async path: (database ID, filter) -> asyncio.Task
+_inflight = {}
+
+
+def _query_body(filter):
+    """Build the first query request body for filter"""
+    body = {"page_size": PAGE_SIZE}
+    if filter:
+        body["filter"] = filter
+    return body
+
+
+def _cache_key(filter, database_id):
+    return (database_id, orjson.dumps(filter, option=orjson.OPT_SORT_KEYS))
+
+
+def _get_cached(key, ttl):
+    """Return cached tasks for key if they are younger than ttl seconds, else None"""
+    cached = _cache.get(key)
+    if cached and time.monotonic() - cached[0] < ttl:
+        return cached[1]
+    return None
+
+
+def _store(key, tasks, ttl):
+    """Cache tasks under key, first dropping entries older than ttl seconds
+    
+    Filters contain dates, so old keys are never looked up again and would otherwise pile up.
+    """
+    now = time.monotonic()
+    for expired in [k for k, (timestamp, _) in _cache.items() if now - timestamp >= ttl]:
+        del _cache[expired]
+    _cache[key] = (now, tasks)
+
+
+class _QueryPageReader:
+    """Builds Tasks from the ijson events of one query response, one Notion page at a time"""
+    
+    def __init__(self, tasks):
+        self.tasks = tasks
+        self.has_more = False
+        self.next_cursor = None
+        self._builder = None
+    
+    def feed(self, prefix, event, value):
+        if self._builder is not None:
+            self._builder.event(event, value)
+            if prefix == "results.item" and event == "end_map":
+                self._add(self._builder.value)
+                self._builder = None
+        elif prefix == "results.item" and event == "start_map":
+            self._builder = ObjectBuilder()
+            self._builder.event(event, value)
+        elif prefix == "has_more":
+            self.has_more = value
+        elif prefix == "next_cursor":
+            self.next_cursor = value
+    
+    def _add(self, page):
+        # The raw page is dropped as soon as it is parsed
+        try:
+            task = parse_page(page)
+        except (KeyError, IndexError, ValueError) as e:
+            print(f"⚠️ Error processing task: {e}")
+            return
+        if task:
+            self.tasks.append(task)
+
+
+def query_database(filter=None, database_id=DATABASE_ID):
+    """Query the database, following next_cursor until every matching task is fetched"""
+    url = f"https://api.notion.com/v1/databases/{database_id}/query"
+    body = _query_body(filter)
+
+    tasks = []
+    while True:
+        reader = _QueryPageReader(tasks)
+        with session.post(url, data=orjson.dumps(body), stream=True) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            for prefix, event, value in ijson.parse(response.raw):
+                reader.feed(prefix, event, value)
+
+        if not reader.has_more or not reader.next_cursor:
+            return tasks
+        body["start_cursor"] = reader.next_cursor
+
+
+async def query_database_async(aio_session, filter=None, database_id=DATABASE_ID):
+    """Non-blocking query_database for the bot, using an aiohttp session created with HEADERS"""
+    url = f"https://api.notion.com/v1/databases/{database_id}/query"
+    body = _query_body(filter)
+
+    tasks = []
+    while True:
+        reader = _QueryPageReader(tasks)
+        async with aio_session.post(url, data=orjson.dumps(body)) as response:
+            response.raise_for_status()
+            async for prefix, event, value in ijson.parse_async(response.content):
+                reader.feed(prefix, event, value)
+
+        if not reader.has_more or not reader.next_cursor:
+            return tasks
+        body["start_cursor"] = reader.next_cursor
+
+
+async def _fetch_tasks_async(key, aio_session, filter, ttl, database_id):
+    try:
+        tasks = await query_database_async(aio_session, filter, database_id)
+        _store(key, tasks, ttl)
+        return tasks
+    finally:
+        del _inflight[key]
+
+
+async def get_tasks_async(aio_session, filter=None, ttl=30, database_id=DATABASE_ID):
+    """Return tasks matching filter, re-querying Notion only when the cache is older than ttl seconds
+    
+    Concurrent callers that miss the cache for the same query all wait on one Notion fetch.
+    """
+    key = _cache_key(filter, database_id)
+    tasks = _get_cached(key, ttl)
+    if tasks is not None:
+        return tasks
+
+    # No await between the lookup and the insert, so this check needs no lock
+    fetch = _inflight.get(key)
+    if fetch is None:
+        fetch = asyncio.ensure_future(_fetch_tasks_async(key, aio_session, filter, ttl, database_id))
+        _inflight[key] = fetch
+
+    # Shield the shared fetch so one cancelled waiter doesn't cancel it for the others
+    return await asyncio.shield(fetch)
+
+
+def invalidate(database_id=None):
+    """Drop cached results for one database, or for all databases if none is given"""
+    if database_id is None:
+        _cache.clear()
+        return
+
+    for key in [key for key in _cache if key[0] == database_id]:
+        del _cache[key]